@@ -1,30 +1,54 @@
+# Trace output in the execution paths; a plain module flag, checked on each call
+DEBUG = False
+
+# Bit masks of the flags inside the status register P
+FLAGS = {
+    'C': 0x01, # Carry
+    'Z': 0x02, # Zero
+    'I': 0x04, # Interrupt Disable
+    'D': 0x08, # Decimal Mode
+    'B': 0x10, # Break Command
+    'U': 0x20, # Unused, always reads as 1
+    'V': 0x40, # Overflow
+    'N': 0x80, # Negative
+}
+
+# The Z and N bits of P for every 8-bit result
+ZN_FLAGS = bytes((0x02 if value == 0 else 0) | (value & 0x80) for value in range(256))
+
+
 class Registers:
+    __slots__ = ('registers',)
+
     def __init__(self):
+        self.registers = {}
         self.initialize_registers()
 
     def initialize_registers(self):
-        self.registers = {
+        # In place, so references to the dict held by the CPU stay valid
+        self.registers.update({
             'A': 0, # Accumulator
             'X': 0, # Register X
             'Y': 0, # Register Y
             'SP': 0xFF, # Stack Pointer
             'PC': 0, # Program Counter
-            'P' : { # Status Register
-                'C': 0x01, # Carry
-                'Z': 0x02, # Zero
-                'I': 0x04, # Interrupt Disable
-                'D': 0x08, # Decimal Mode
-                'B': 0x10, # Break Command
-                'V': 0x20, # Overflow
-                'N': 0x80, # Negative
-
-            },
-        }
+            'P': 0x24, # Status Register, flags packed as in FLAGS (I and U set)
+        })
 
     def reset(self, pc):
         self.initialize_registers()
         self.registers['PC'] = pc
 
+    def snapshot(self):
+        # Packed as A, X, Y, SP, P, PC low, PC high
+        regs = self.registers
+        pc = regs['PC']
+        return bytes((regs['A'], regs['X'], regs['Y'], regs['SP'], regs['P'], pc & 0xFF, pc >> 8))
+
+    def restore(self, state):
+        a, x, y, sp, p, pc_low, pc_high = state
+        self.registers.update(A=a, X=x, Y=y, SP=sp, P=p, PC=pc_low | (pc_high << 8))
+
     def update_register(self, register, value):
                 if register in self.registers:
                     self.registers[register] = value
@@ -38,21 +62,33 @@ class Registers:
             raise ValueError(f"Register {register} not found.")
         
     def update_flag(self, flag, value):
-        if flag in self.registers['P']:
-            self.registers['P'][flag] = value
+        if flag in FLAGS:
+            if value:
+                self.registers['P'] |= FLAGS[flag]
+            else:
+                self.registers['P'] &= ~FLAGS[flag] & 0xFF
         else:
             raise ValueError(f"Flag {flag} not found.")
         
+    def get_status_byte(self, pushing=False):
+        # U always reads as 1; B only exists in the copy pushed by BRK/PHP
+        return self.registers['P'] | 0x20 | (pushing << 4)
+
     def get_flag(self, flag):
-        if flag in self.registers['P']:
-            return self.registers['P'][flag]
+        if flag in FLAGS:
+            return 1 if self.registers['P'] & FLAGS[flag] else 0
         else:
             raise ValueError(f"Flag {flag} not found.")
             
 
 class Bus:
+    __slots__ = ('memory', 'dirty_pages')
+
     def __init__(self):
-        self.memory = [0x00] * 64 * 1024
+        # Flat 64K of bytes: C-level indexing and slicing, and values are kept to 0..255
+        self.memory = bytearray(64 * 1024)
+        # One flag per 256-byte page, set on writes so the CPU can drop stale decoded instructions
+        self.dirty_pages = bytearray(256)
 
     def read(self, address):
         if address < 0x0000 or address > 0xFFFF:
@@ -60,39 +96,74 @@ class Bus:
         return self.memory[address]
     
     def read_word(self, address):
-        if address < 0x0000 or address > 0xFFFE:
+        if address < 0x0000 or address > 0xFFFF:
             raise ValueError(f"Address {address} out of bounds")
-        low_byte = self.memory[address]
-        high_byte = self.memory[address + 1]
-        return (high_byte << 8) | low_byte
+        # The high byte of a word at 0xFFFF wraps around to 0x0000
+        return self.memory[address] | (self.memory[(address + 1) & 0xFFFF] << 8)
     
     def write(self, address, value):
         if address < 0x0000 or address > 0xFFFF:
             raise ValueError(f"Address {address} out of bounds")
         self.memory[address] = value
+        # An instruction is at most 3 bytes, so one touching this byte may start on the previous page
+        self.dirty_pages[address >> 8] = 1
+        self.dirty_pages[((address - 2) & 0xFFFF) >> 8] = 1
+
+    def load(self, address, data):
+        # Copy a whole block with one slice assignment instead of per-byte writes
+        end = address + len(data)
+        if address < 0x0000 or end > 0x10000:
+            raise ValueError(f"Block {address}:{end} out of bounds")
+        self.memory[address:end] = data
+        first_page = address >> 8
+        last_page = (end - 1) >> 8
+        self.dirty_pages[first_page:last_page + 1] = b'\x01' * (last_page + 1 - first_page)
+        # Same as write(): an instruction starting up to 2 bytes earlier may be on the previous page, wrapping below 0x0000
+        self.dirty_pages[((address - 2) & 0xFFFF) >> 8] = 1
 
 
 class CPU:
-    def __init__(self, bus):
-        self.bus = bus
-        self.running = True
-        self.registers = Registers()
-        self.bus = Bus()
-        self.halted = False
-        self.opcode_table = {
-            'ADC': ('v', [(0x69, 'Imm', 2), (0x65, 'ZP', 3), (0x75, 'ZX', 4), (0x6D, 'A', 4), (0x7D, 'AX', 4), (0x79, 'AY', 4), (0x61, 'IX', 6), (0x71, 'IY', 5)]),
+    # Shared by every CPU instance: mnemonic -> (operand kind, [(opcode, mode, cycles), ...])
+    opcode_table = {
+        'ADC': ('v', [(0x69, 'Imm', 2), (0x65, 'ZP', 3), (0x75, 'ZX', 4), (0x6D, 'A', 4), (0x7D, 'AX', 4), (0x79, 'AY', 4), (0x61, 'IX', 6), (0x71, 'IY', 5)]),
 
-            'AND': ('a', [(0x29, 'Imm', 2), (0x25, 'ZP', 3), (0x35, 'ZX', 4), (0x2D, 'A', 4), (0x3D, 'AX', 4), (0x39, 'AY', 4), (0x21, 'IX', 6), (0x31, 'IY', 5)]),
+        'AND': ('v', [(0x29, 'Imm', 2), (0x25, 'ZP', 3), (0x35, 'ZX', 4), (0x2D, 'A', 4), (0x3D, 'AX', 4), (0x39, 'AY', 4), (0x21, 'IX', 6), (0x31, 'IY', 5)]),
 
-            'ASL': ('a', [(0x0A, 'A', 2), (0x06, 'ZP', 5), (0x16, 'ZX', 6), (0x0E, 'A', 6), (0x1E, 'AX', 7)]),
+        'ASL': ('a', [(0x0A, 'Acc', 2), (0x06, 'ZP', 5), (0x16, 'ZX', 6), (0x0E, 'A', 6), (0x1E, 'AX', 7)]),
 
-            'LDA': ('v', [(0xA9, 'Imm', 2), (0xA5, 'ZP', 3), (0xB5, 'ZX', 4), (0xAD, 'A', 4), (0xBD, 'AX', 4), (0xB9, 'AY', 4), (0xA1, 'IX', 6), (0xB1, 'IY', 5)]),
+        'LDA': ('v', [(0xA9, 'Imm', 2), (0xA5, 'ZP', 3), (0xB5, 'ZX', 4), (0xAD, 'A', 4), (0xBD, 'AX', 4), (0xB9, 'AY', 4), (0xA1, 'IX', 6), (0xB1, 'IY', 5)]),
 
-            'STA': ('a', [(0x85, 'ZP', 3), (0x95, 'ZX', 4), (0x8D, 'A', 4), (0x9D, 'AX', 4), (0x99, 'AY', 4), (0x81, 'IX', 6), (0x91, 'IY', 5)]),
+        'STA': ('a', [(0x85, 'ZP', 3), (0x95, 'ZX', 4), (0x8D, 'A', 4), (0x9D, 'AX', 4), (0x99, 'AY', 4), (0x81, 'IX', 6), (0x91, 'IY', 5)]),
 
-        }
+    }
+    operand_sizes = {
+        'Acc': 0, 'Imm': 1, 'ZP': 1, 'ZX': 1, 'ZY': 1,
+        'A': 2, 'AX': 2, 'AY': 2, 'I': 2, 'IX': 1, 'IY': 1,
+    }
+    # Order in which requested interrupts are serviced; BRK is an instruction, not a line that can be requested
+    interrupt_priority = ('RESET', 'ABORT', 'NMI', 'IRQ')
+    # Long mode names still accepted by execute()
+    mode_aliases = {'immediate': 'Imm', 'zero_page': 'ZP', 'absolute': 'A'}
+
+    def __init__(self, bus):
+        self.bus = bus
+        # Reads skip Bus.read; writes still go through the bus so dirty pages are tracked
+        self.memory = bus.memory
+        # Page 1 view, indexed by SP directly
+        self.stack = memoryview(self.memory)[0x0100:0x0200]
+        self.running = True
+        self.registers = Registers()
+        # The register dict itself, bound once for the instruction bodies
+        self.regs = self.registers.registers
+        self.halted = False
+        self.cycles = 0
+        # Set by request_interrupt(), serviced by run() between blocks; one slot per type so none replaces another
+        self.pending_interrupts = set()
+        # Unknown opcodes already reported, so each one is printed only once
+        self.seen_unknown = set()
         self.addressing_modes = {
-            'Imm': self.fetch_byte,
+            'Acc': self.accumulator_address,
+            'Imm': self.immediate_value,
             'ZP': self.zero_page_address,
             'ZX': self.zero_page_x_address,
             'ZY': self.zero_page_y_address,
@@ -103,57 +174,97 @@ class CPU:
             'IX': self.indirect_x_address,
             'IY': self.indirect_y_address,
         }
+        # Indexed by operand size
+        self.operand_fetchers = (self.fetch_no_operand, self.fetch_byte, self.fetch_word)
+        # Decoded (handler, operand, next_pc, cycles) per address, filled the first time PC lands there
+        self.decode_cache = [None] * 0x10000
+        # (decoded instructions, total cycles, PC after the block) keyed by start address, executed by run() in one go
+        self.block_cache = {}
+        # Bind each instruction once so execute() doesn't build a new bound method per call
+        self.instructions = {name: getattr(self, name) for name in self.opcode_table}
+        # (accumulator form, memory form) used by the dispatch table instead of the generic instruction
+        self.mode_variants = {
+            'ASL': (self.ASL_accumulator, self.ASL_memory),
+        }
+        # LDA followed by STA to a fixed address, run as one handler when translating blocks
+        self.fused_pairs = {
+            (0xA9, 0x85): self.load_store_immediate, # LDA #imm; STA zp
+            (0xA9, 0x8D): self.load_store_immediate, # LDA #imm; STA abs
+            (0xA5, 0x85): self.load_store_memory, # LDA zp; STA zp
+            (0xA5, 0x8D): self.load_store_memory, # LDA zp; STA abs
+            (0xAD, 0x85): self.load_store_memory, # LDA abs; STA zp
+            (0xAD, 0x8D): self.load_store_memory, # LDA abs; STA abs
+        }
+        self._build_dispatch_table()
+
+    @classmethod
+    def _build_opcode_tables(cls):
+        # Parallel per-opcode tables, built once for the class since they don't depend on an instance
+        cls.opcode_instructions = [None] * 256
+        operand_sizes = bytearray(256)
+        cycle_counts = bytearray(256)
+        cls.block_enders = set()
+        for instruction, (kind, entries) in cls.opcode_table.items():
+            for opcode, mode, cycles in entries:
+                cls.opcode_instructions[opcode] = instruction
+                operand_sizes[opcode] = cls.operand_sizes[mode]
+                cycle_counts[opcode] = cycles
+                if kind == 'a' and mode != 'Acc':
+                    # A memory write may patch code later in the block, so end the block there
+                    cls.block_enders.add(opcode)
+        cls.opcode_operand_sizes = bytes(operand_sizes)
+        cls.opcode_cycles = bytes(cycle_counts)
+
+    def _build_dispatch_table(self):
+        # One pre-bound handler per opcode, so run() does a single index and call
+        self.dispatch = [None] * 256
+        for instruction, (kind, entries) in self.opcode_table.items():
+            variants = self.mode_variants.get(instruction)
+            for opcode, mode, cycles in entries:
+                function = variants[mode != 'Acc'] if variants else self.instructions[instruction]
+                self.dispatch[opcode] = self._make_handler(function, kind, self.addressing_modes[mode], mode)
+
+    def _make_handler(self, function, kind, address_mode, mode):
+        if mode == 'Imm' or mode == 'Acc':
+            # The raw operand (the value, or None for the accumulator) is already what the instruction takes
+            return function
+        memory = self.memory
+        if kind == 'a':
+            def handler(operand):
+                function(address_mode(operand))
+        else:
+            def handler(operand):
+                function(memory[address_mode(operand)])
+        return handler
 
     def reset(self):
         # Redefine all registers to initial values
-        for register in self.registers.registers:
-            if register != 'P':
-                self.registers.update_register(register, 0)
-            else:
-                for flag in self.registers.registers['P']:
-                    self.registers.update_flag(flag, 0)
         self.registers.reset(self.bus.read(0xFFFC) | (self.bus.read(0xFFFD) << 8))
 
     def clear_flag(self, flag):
-        if flag in self.registers['P']:
-            self.registers['P'][flag] = 0
-        else:
-            raise ValueError(f"Flag {flag} not found.")
+        self.registers.update_flag(flag, 0)
         
-    def abort (self):
+    def service_interrupt(self, vector, brk=False):
         # Push PC and P to stack
-        self.push_stack_word(self.registers['PC'])
-        self.push_stack(self.registers['P'])
+        self.push_interrupt_frame(self.registers.get_status_byte(brk))
 
         # Set I flag to 1
-        self.registers['P']['I'] = 1
-
-        # Read address from 0xFFFE and 0xFFFF
-        self.registers['PC'] = self.bus.read(0xFFFE) | (self.bus.read(0xFFFF) << 8)
+        regs = self.regs
+        regs['P'] |= 0x04
 
-    def nmi(self):
-        # Push PC and P to stack
-        self.push_stack_word(self.registers['PC'])
-        self.push_stack(self.registers['P'])
+        # Jump through the vector; read every time since the vectors live in RAM
+        regs['PC'] = self.bus.read_word(vector)
 
-        # Set I flag to 1
-        self.registers['P']['I'] = 1
+    def abort (self):
+        self.service_interrupt(0xFFFE)
 
-        # Read address from 0xFFFA and 0xFFFB
-        self.registers['PC'] = self.bus.read(0xFFFA) | (self.bus.read(0xFFFB) << 8)
+    def nmi(self):
+        self.service_interrupt(0xFFFA)
 
-    def irq_brk(self):
+    def irq_brk(self, brk=False):
         # Verify if Interrupt is Maskable
-        if self.registers['P']['I'] == 0:
-            # Push PC and P to stack
-            self.push_stack_word(self.registers['PC'])
-            self.push_stack(self.registers['P'])
-
-            # Set I flag to 1
-            self.registers['P']['I'] = 1
-
-            # Read address from 0xFFFE and 0xFFFF
-            self.registers['PC'] = self.bus.read(0xFFFE) | (self.bus.read(0xFFFF) << 8)
+        if not self.regs['P'] & 0x04:
+            self.service_interrupt(0xFFFE, brk)
 
     def handle_interrupt(self, interrupt_type):
         if interrupt_type == 'RESET':
@@ -163,25 +274,44 @@ class CPU:
         elif interrupt_type == 'NMI':
             self.nmi()
         elif interrupt_type == 'IRQ' or interrupt_type == 'BRK':
-            self.irq_brk()
+            self.irq_brk(interrupt_type == 'BRK')
             pass
         else:
             raise ValueError(f"Interrupt type {interrupt_type} not found.")
 
+    def request_interrupt(self, interrupt_type):
+        if interrupt_type not in self.interrupt_priority:
+            raise ValueError(f"Interrupt type {interrupt_type} not found.")
+        self.pending_interrupts.add(interrupt_type)
+
+    def service_pending_interrupt(self):
+        pending = self.pending_interrupts
+        for interrupt_type in self.interrupt_priority:
+            if interrupt_type in pending:
+                # A masked IRQ stays pending until I is cleared
+                if interrupt_type == 'IRQ' and self.regs['P'] & 0x04:
+                    continue
+                pending.discard(interrupt_type)
+                self.handle_interrupt(interrupt_type)
+                return
+
     def fetch_byte(self):
-        value = self.bus.read(self.registers.get_register('PC'))
-        self.registers.update_register('PC', self.registers.get_register('PC') + 1)
+        pc = self.registers.get_register('PC')
+        value = self.memory[pc]
+        self.registers.update_register('PC', (pc + 1) & 0xFFFF)
         return value
 
     def fetch_word(self):
-        low_byte = self.fetch_byte()
-        high_byte = self.fetch_byte()
-        return (high_byte << 8) | low_byte
+        pc = self.registers.get_register('PC')
+        memory = self.memory
+        word = memory[pc] | (memory[(pc + 1) & 0xFFFF] << 8)
+        self.registers.update_register('PC', (pc + 2) & 0xFFFF)
+        return word
     
     def push_stack(self, value):
         sp = self.registers.get_register('SP')
-        self.bus.write(0x0100 + sp, value)
-        self.registers.update_register('SP', sp - 1)
+        self.bus.write(0x0100 | sp, value)
+        self.registers.update_register('SP', (sp - 1) & 0xFF)
 
     def push_stack_word(self, value):
         high_byte = (value & 0xFF00) >> 8
@@ -189,9 +319,20 @@ class CPU:
         self.push_stack(high_byte)
         self.push_stack(low_byte)
 
+    def push_interrupt_frame(self, status):
+        # PC high, PC low and P in one go, updating SP once
+        regs = self.regs
+        sp = regs['SP']
+        pc = regs['PC']
+        write = self.bus.write
+        write(0x0100 | sp, pc >> 8)
+        write(0x0100 | ((sp - 1) & 0xFF), pc & 0xFF)
+        write(0x0100 | ((sp - 2) & 0xFF), status)
+        regs['SP'] = (sp - 3) & 0xFF
+
     def pop_stack(self):
-        sp = self.registers.get_register('SP') + 1
-        value = self.bus.read(0x0100 + sp)
+        sp = (self.registers.get_register('SP') + 1) & 0xFF
+        value = self.stack[sp]
         self.registers.update_register('SP', sp)
         return value
     
@@ -200,142 +341,267 @@ class CPU:
         high_byte = self.pop_stack()
         return (high_byte << 8) | low_byte
 
+    def fetch_operand(self, size):
+        return self.operand_fetchers[size]()
+
+    def fetch_no_operand(self):
+        return None
+
+    def decode_at(self, pc):
+        memory = self.memory
+        opcode = memory[pc]
+        handler = self.dispatch[opcode]
+        if handler is None:
+            return None
+        size = self.opcode_operand_sizes[opcode]
+        if size == 0:
+            operand = None
+        elif size == 1:
+            operand = memory[(pc + 1) & 0xFFFF]
+        else:
+            operand = memory[(pc + 1) & 0xFFFF] | (memory[(pc + 2) & 0xFFFF] << 8)
+        return (handler, operand, (pc + 1 + size) & 0xFFFF, self.opcode_cycles[opcode])
+
+    def cached_decode(self, pc):
+        # Entries filled by predecode() or an earlier visit; a miss decodes and stores
+        entry = self.decode_cache[pc]
+        if entry is None:
+            entry = self.decode_at(pc)
+            self.decode_cache[pc] = entry
+        return entry
+
+    def invalidate_page(self, page):
+        start = page << 8
+        self.decode_cache[start:start + 0x100] = [None] * 0x100
+        # Blocks are short enough to span at most two pages, so only those starting here or on the page before can be stale
+        previous = (page - 1) & 0xFF
+        for block_start in [pc for pc in self.block_cache if (pc >> 8) == page or (pc >> 8) == previous]:
+            del self.block_cache[block_start]
+        self.bus.dirty_pages[page] = 0
+
+    def predecode(self, start, end):
+        # Drop whatever the load made stale, then decode every instruction in [start, end) up front
+        for page in range(start >> 8, ((end - 1) >> 8) + 1):
+            self.invalidate_page(page)
+        # The page an instruction just before start begins on, wrapping like Bus.write()
+        self.invalidate_page(((start - 2) & 0xFFFF) >> 8)
+        pc = start
+        while pc < end:
+            entry = self.decode_at(pc)
+            if entry is None:
+                pc += 1  # data or an unknown opcode
+                continue
+            self.decode_cache[pc] = entry
+            pc += 1 + self.opcode_operand_sizes[self.memory[pc]]
+
+    def translate_block(self, pc):
+        block = []
+        cycles = 0
+        while len(block) < 32:
+            entry = self.cached_decode(pc)
+            if entry is None:
+                break
+            fused = self.fused_pairs.get((self.memory[pc], self.memory[entry[2]]))
+            if fused is not None:
+                # The STA half ends the block just like a plain store would
+                second = self.cached_decode(entry[2])
+                block.append((fused, (entry[1], second[1]), second[2], entry[3] + second[3]))
+                cycles += entry[3] + second[3]
+                break
+            block.append(entry)
+            cycles += entry[3]
+            if self.memory[pc] in self.block_enders:
+                break
+            pc = entry[2]
+        return (tuple(block), cycles, block[-1][2] if block else pc)
+
+    def run_block(self, budget=None):
+        pc = self.regs['PC']
+        page = pc >> 8
+        next_page = (page + 1) & 0xFF
+        if self.bus.dirty_pages[page]:
+            self.invalidate_page(page)
+        if self.bus.dirty_pages[next_page]:
+            self.invalidate_page(next_page)
+        block = self.block_cache.get(pc)
+        if block is None:
+            block = self.translate_block(pc)
+            if not block[1]:
+                return 0
+            self.block_cache[pc] = block
+        entries, cycles, end_pc = block
+        if budget is not None and cycles > budget:
+            # The whole block would overrun the budget, so run only its first instruction
+            handler, operand, next_pc, cycles = entries[0]
+            handler(operand)
+            self.regs['PC'] = next_pc
+            return cycles
+        # No handler reads or moves PC, so it is written back once for the whole block
+        for handler, operand, _, _ in entries:
+            handler(operand)
+        self.regs['PC'] = end_pc
+        return cycles
+
+    def step(self):
+        pc = self.regs['PC']
+        if self.bus.dirty_pages[pc >> 8]:
+            self.invalidate_page(pc >> 8)
+        entry = self.cached_decode(pc)
+        if entry is None:
+            return 0
+        handler, operand, next_pc, cycles = entry
+        self.regs['PC'] = next_pc
+        handler(operand)
+        self.cycles += cycles
+        return cycles
+
     def decode_instruction(self, opcode):
-        for instruction, info in self.opcode_table.items():
-            if opcode in [code for code, mode, cycles in info[1]]:
-                return instruction
-        raise ValueError(f"Opcode {opcode} not found.")
+        instruction = self.opcode_instructions[opcode]
+        if instruction is None:
+            raise ValueError(f"Opcode {opcode} not found.")
+        return instruction
 
     def execute(self, opcode, addressing_mode):
-        print(f"Modo de endereçamento: {addressing_mode}")
-        value = None  # valor padrão
-        if addressing_mode == 'immediate' or addressing_mode == 'Imm':
-            value = self.fetch_byte()
-        elif addressing_mode == 'zero_page' or addressing_mode == 'ZP':
-            address = self.zero_page_address()
-            value = self.bus.read(address)
-        elif addressing_mode == 'absolute':
-            address = self.absolute_address()
-            value = self.bus.read(address)
-        
+        if DEBUG:
+            print(f"Modo de endereçamento: {addressing_mode}")
         instruction = self.decode_instruction(opcode)
-        if value is not None:
-            getattr(self, instruction)(value)
-        else:
+        mode = self.mode_aliases.get(addressing_mode, addressing_mode)
+        if mode not in self.addressing_modes:
             print(f"Modo de endereçamento {addressing_mode} não suportado.")
+            return
+
+        operand = self.fetch_address(mode)
+        if self.opcode_table[instruction][0] == 'v' and mode != 'Imm':
+            # Instructions tagged 'v' take the value stored at the effective address
+            operand = self.memory[operand]
+        self.instructions[instruction](operand)
 
     def ADC(self, value):
-        a = self.registers.get_register('A')
-        c = self.registers.get_flag('C')
-        result = a + value + c
-        self.registers.update_register('A', result & 0xFF)
-        self.registers.update_flag('C', 1 if result > 0xFF else 0)
-        self.registers.update_flag('Z', 1 if (result & 0xFF) == 0 else 0)
-        self.registers.update_flag('N', 1 if (result & 0x80) != 0 else 0)
+        # Binary mode only: the D flag is not emulated
+        regs = self.regs
+        a = regs['A']
+        p = regs['P']
+        result = a + value + (p & 0x01)
+        r = result & 0xFF
+        # V is set when both inputs have the same sign and the result has the other one
+        overflow = ((a ^ r) & (value ^ r) & 0x80) >> 1
+        regs['A'] = r
+        regs['P'] = (p & 0x3C) | (result >> 8) | overflow | ZN_FLAGS[r]
 
     def AND(self, value):
-        a = self.registers.get_register('A')
-        result = a & value
-        self.registers.update_register('A', result)
-        self.registers.update_flag('Z', 1 if result == 0 else 0)
-        self.registers.update_flag('N', 1 if (result & 0x80) != 0 else 0)
-
-    def ASL(self, value):
-        result = value << 1
-        self.registers.update_flag('C', 1 if (result & 0x80) != 0 else 0)
-        self.registers.update_flag('Z', 1 if (result & 0xFF) == 0 else 0)
-        self.registers.update_flag('N', 1 if (result & 0x80) != 0 else 0)
-        return result & 0xFF
+        regs = self.regs
+        result = regs['A'] & value
+        regs['A'] = result
+        regs['P'] = (regs['P'] & 0x7D) | ZN_FLAGS[result]
+
+    def ASL(self, address):
+        # A None address means the accumulator
+        if address is None:
+            self.ASL_accumulator(address)
+        else:
+            self.ASL_memory(address)
+
+    def ASL_accumulator(self, operand):
+        regs = self.regs
+        value = regs['A']
+        result = (value << 1) & 0xFF
+        # C takes the bit shifted out of bit 7
+        regs['P'] = (regs['P'] & 0x7C) | (value >> 7) | ZN_FLAGS[result]
+        regs['A'] = result
+
+    def ASL_memory(self, address):
+        regs = self.regs
+        value = self.memory[address]
+        result = (value << 1) & 0xFF
+        regs['P'] = (regs['P'] & 0x7C) | (value >> 7) | ZN_FLAGS[result]
+        self.bus.write(address, result)
     
     def LDA(self, value):
-        value = int(value)
-        self.registers.update_register('A', value)
-        self.registers.update_flag('Z', 1 if value == 0 else 0)
-        self.registers.update_flag('N', 1 if (value & 0x80) != 0 else 0)
+        regs = self.regs
+        regs['A'] = value
+        regs['P'] = (regs['P'] & 0x7D) | ZN_FLAGS[value]
     
-    def STA(self, addressing_mode):
-        value = self.registers.get_register('A')
-
-        if addressing_mode == 'ZP':  # Zero Page
-            addr = self.fetch_byte()
-            self.memory[addr] = value
-        elif addressing_mode == 'ZX':  # Zero Page, X
-            addr = self.fetch_byte() + self.registers.get_register('X')
-            self.memory[addr] = value
-        elif addressing_mode == 'A':  # Absoluto
-            addr = self.fetch_word()
-            self.memory[addr] = value
-        elif addressing_mode == 'AX':  # Absoluto, X
-            addr = self.fetch_word() + self.registers.get_register('X')
-            self.memory[addr] = value
-        elif addressing_mode == 'AY':  # Absoluto, Y
-            addr = self.fetch_word() + self.registers.get_register('Y')
-            self.memory[addr] = value
-        elif addressing_mode == 'IX':  # Indireto, X
-            base = self.fetch_byte() + self.registers.get_register('X')
-            addr = self.memory[base] + (self.memory[(base + 1) % 0x100] << 8)
-            self.memory[addr] = value
-        elif addressing_mode == 'IY':  # Indireto, Y
-            base = self.fetch_byte()
-            addr = self.memory[base] + (self.memory[(base + 1) % 0x100] << 8) + self.registers.get_register('Y')
-            self.memory[addr] = value
-        else:
-            raise ValueError(f'Modo de endereçamento {addressing_mode} não suportado')
-        
+    def STA(self, address):
+        self.bus.write(address, self.regs['A'])
 
-    def read_pc(self):
-        value = self.bus.read(self.registers.get_register('PC'))
-        self.registers.update_register('PC', self.registers.get_register('PC') + 1)
-        return value
+    def load_store_immediate(self, operands):
+        value, address = operands
+        regs = self.regs
+        regs['A'] = value
+        regs['P'] = (regs['P'] & 0x7D) | ZN_FLAGS[value]
+        self.bus.write(address, value)
 
-    def read_word_pc(self):
-        value = self.bus.read_word(self.registers.get_register('PC'))
-        self.registers.update_register('PC', self.registers.get_register('PC') + 2)  # increment by 2 because we're reading a word
-        return value
+    def load_store_memory(self, operands):
+        source, address = operands
+        value = self.memory[source]
+        regs = self.regs
+        regs['A'] = value
+        regs['P'] = (regs['P'] & 0x7D) | ZN_FLAGS[value]
+        self.bus.write(address, value)
+
+    def accumulator_address(self, operand):
+        return None
+
+    def immediate_value(self, operand):
+        return operand
 
-    def zero_page_address(self):
-        return self.read_pc()
+    def zero_page_address(self, operand):
+        return operand
 
-    def zero_page_x_address(self):
-        return (self.read_pc() + self.registers['X']) & 0xFF
+    def zero_page_x_address(self, operand):
+        return (operand + self.regs['X']) & 0xFF
 
-    def zero_page_y_address(self):
-        return (self.read_pc() + self.registers['Y']) & 0xFF
+    def zero_page_y_address(self, operand):
+        return (operand + self.regs['Y']) & 0xFF
 
-    def absolute_address(self):
-        return self.read_word_pc()
+    def absolute_address(self, operand):
+        return operand
 
-    def absolute_x_address(self):
-        return (self.read_word_pc() + self.registers['X']) & 0xFFFF
+    def absolute_x_address(self, operand):
+        return (operand + self.regs['X']) & 0xFFFF
 
-    def absolute_y_address(self):
-        return (self.read_word_pc() + self.registers['Y']) & 0xFFFF
+    def absolute_y_address(self, operand):
+        return (operand + self.regs['Y']) & 0xFFFF
 
-    def indirect_address(self):
-        return self.bus.read_word(self.read_word_pc())
+    def indirect_address(self, operand):
+        # The 6502 never carries into the pointer's high byte: ($10FF) reads its high byte from $1000
+        memory = self.memory
+        return memory[operand] | (memory[(operand & 0xFF00) | ((operand + 1) & 0xFF)] << 8)
 
-    def indirect_x_address(self):
-        return self.bus.read_word((self.read_pc() + self.registers['X']) & 0xFF)
+    def indirect_x_address(self, operand):
+        pointer = (operand + self.regs['X']) & 0xFF
+        return self.memory[pointer] | (self.memory[(pointer + 1) & 0xFF] << 8)
 
-    def indirect_y_address(self):
-        return (self.bus.read_word(self.read_pc()) + self.registers['Y']) & 0xFFFF
+    def indirect_y_address(self, operand):
+        address = self.memory[operand] | (self.memory[(operand + 1) & 0xFF] << 8)
+        return (address + self.regs['Y']) & 0xFFFF
     
     def fetch_address(self, mode):
         if mode in self.addressing_modes:
-            return self.addressing_modes[mode]()
+            return self.addressing_modes[mode](self.fetch_operand(self.operand_sizes[mode]))
         else:
             raise ValueError(f"Addressing mode {mode} not found.")
 
 
-    def run(self):
-        while not self.halted:
-            opcode = self.fetch_byte()
-            if opcode in self.addressing_modes:
-                addressing_mode = self.addressing_modes[opcode]  # determine the addressing mode
-                self.execute(opcode, addressing_mode)
-            else:
-                print(f"Opcode {opcode} não encontrado.")
+    def run(self, budget=None):
+        # Without a budget, runs until halted or an unknown opcode; returns the cycles spent
+        spent = 0
+        pending = self.pending_interrupts
+        regs = self.regs
+        while not self.halted and (budget is None or spent < budget):
+            # A lone masked IRQ can't be taken yet, so skip the priority scan
+            if pending and not (regs['P'] & 0x04 and len(pending) == 1 and 'IRQ' in pending):
+                self.service_pending_interrupt()
+            cycles = self.run_block(None if budget is None else budget - spent)
+            if not cycles:
+                opcode = self.bus.read(self.registers.get_register('PC'))
+                if opcode not in self.seen_unknown:
+                    self.seen_unknown.add(opcode)
+                    print(f"Opcode {opcode} não encontrado.")
                 break  # or continue, depending on what you want to do when an unknown opcode is encountered
+            spent += cycles
+        self.cycles += spent
+        return spent
 
     def print_registers(self):
         for register, value in self.registers.registers.items():
@@ -343,25 +609,27 @@ class CPU:
                 print(f"{register}: {value}")
             else: 
                 print('P:')
-                for flag, value in self.registers.registers['P'].items():
-                    print(f"\t{flag}: {value}")
+                for flag in FLAGS:
+                    print(f"\t{flag}: {self.registers.get_flag(flag)}")
 
 
     def load_and_execute_program(self, filename):
         address = 0x0600
 
+        # Whole file in one read and one split, instead of a pass per line
         with open(filename, 'r') as file:
-            for line in file:
-                words = line.split()
-                for word in words:
-                    opcode = int(word, 16)
-                    self.bus.write(address, opcode)
-                    address += 1
+            program = [int(word, 16) for word in file.read().split()]
+        self.bus.load(address, program)
+        self.predecode(address, address + len(program))
 
         self.registers.update_register('PC', 0x0100)
         self.run()
 
 
-bus = Bus()
-cpu = CPU(bus)
-cpu.load_and_execute_program('program.txt')
\ No newline at end of file
+CPU._build_opcode_tables()
+
+
+if __name__ == '__main__':
+    bus = Bus()
+    cpu = CPU(bus)
+    cpu.load_and_execute_program('program.txt')
\ No newline at end of file
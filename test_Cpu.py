@@ -29,7 +29,7 @@ class TestCPU(unittest.TestCase):
     def test_ASL(self):
         self.cpu.registers.update_register('A', 0x80)
         self.cpu.bus.write(0x0100, 0x0A)  # ASL opcode
-        self.cpu.execute(0x0A, 'A')
+        self.cpu.execute(0x0A, 'Acc')
         self.assertEqual(self.cpu.registers.get_register('A'), 0x00)
         self.assertEqual(self.cpu.registers.get_flag('C'), 1)
         self.assertEqual(self.cpu.registers.get_flag('Z'), 1)
@@ -50,5 +50,132 @@ class TestCPU(unittest.TestCase):
         self.cpu.execute(0x85, 'ZP')
         self.assertEqual(self.cpu.bus.read(0x0010), 0x55)
 
+    def test_run(self):
+        # LDA #$01; STA $0200; LDA #$05; STA $0201
+        self.cpu.bus.load(0x0600, [0xA9, 0x01, 0x8D, 0x00, 0x02, 0xA9, 0x05, 0x8D, 0x01, 0x02])
+        self.cpu.registers.update_register('PC', 0x0600)
+        self.assertEqual(self.cpu.run(), 12)
+        self.assertEqual(self.cpu.bus.read(0x0200), 0x01)
+        self.assertEqual(self.cpu.bus.read(0x0201), 0x05)
+        self.assertEqual(self.cpu.registers.get_register('A'), 0x05)
+
+    def test_step_sees_modified_code(self):
+        self.cpu.bus.load(0x0600, [0xA9, 0x01])  # LDA #$01
+        self.cpu.registers.update_register('PC', 0x0600)
+        self.cpu.step()
+        self.cpu.bus.write(0x0601, 0x02)  # patch the already decoded operand
+        self.cpu.registers.update_register('PC', 0x0600)
+        self.cpu.step()
+        self.assertEqual(self.cpu.registers.get_register('A'), 0x02)
+
+    def test_run_uses_predecoded_entries(self):
+        self.cpu.bus.load(0x0600, [0xA9, 0x01, 0x85, 0x10])  # LDA #$01; STA $10
+        self.cpu.predecode(0x0600, 0x0604)
+        self.cpu.memory[0x0601] = 0x02  # behind the bus, so the page stays clean
+        self.cpu.registers.update_register('PC', 0x0600)
+        self.cpu.run()
+        self.assertEqual(self.cpu.bus.read(0x0010), 0x01)
+
+    def test_step_sees_load_across_wrap(self):
+        self.cpu.bus.load(0xFFFE, [0xAD, 0x10])  # LDA $xx10, high byte wraps to $0000
+        self.cpu.bus.load(0x0000, [0x20])
+        self.cpu.bus.load(0x1010, [0x11])
+        self.cpu.bus.load(0x2010, [0x22])
+        self.cpu.registers.update_register('PC', 0xFFFE)
+        self.cpu.step()
+        self.cpu.bus.load(0x0000, [0x10])
+        self.cpu.registers.update_register('PC', 0xFFFE)
+        self.cpu.step()
+        self.assertEqual(self.cpu.registers.get_register('A'), 0x11)
+
+    def test_run_budget(self):
+        self.cpu.bus.load(0x0600, [0xA9, 0x01, 0x85, 0x10, 0xA9, 0x02, 0x85, 0x11])
+        self.cpu.registers.update_register('PC', 0x0600)
+        self.assertEqual(self.cpu.run(5), 5)  # stops after the first LDA/STA block
+        self.assertEqual(self.cpu.registers.get_register('PC'), 0x0604)
+        self.assertEqual(self.cpu.cycles, 5)
+
+    def test_run_budget_within_block(self):
+        self.cpu.bus.load(0x0600, [0xA9, 0x01] * 16)  # LDA #$01, sixteen times
+        self.cpu.registers.update_register('PC', 0x0600)
+        self.assertEqual(self.cpu.run(3), 4)  # two LDAs, not the whole block
+        self.assertEqual(self.cpu.registers.get_register('PC'), 0x0604)
+
+    def test_run_services_pending_interrupt(self):
+        self.cpu.bus.load(0xFFFA, [0x00, 0x07])  # NMI vector -> $0700
+        self.cpu.bus.load(0x0700, [0xA9, 0x07])  # LDA #$07
+        self.cpu.registers.update_register('PC', 0x0600)
+        self.cpu.request_interrupt('NMI')
+        self.cpu.run()
+        self.assertEqual(self.cpu.registers.get_register('A'), 0x07)
+        self.assertFalse(self.cpu.pending_interrupts)
+
+    def test_masked_irq_stays_pending(self):
+        self.cpu.bus.load(0x0600, [0xA9, 0x01])  # LDA #$01
+        self.cpu.registers.update_register('PC', 0x0600)
+        self.cpu.registers.update_flag('I', 1)
+        self.cpu.request_interrupt('IRQ')
+        self.cpu.run()
+        self.assertEqual(self.cpu.registers.get_register('A'), 0x01)
+        self.assertIn('IRQ', self.cpu.pending_interrupts)
+
+    def test_request_brk_rejected(self):
+        with self.assertRaises(ValueError):
+            self.cpu.request_interrupt('BRK')
+
+    def test_irq_does_not_replace_pending_nmi(self):
+        self.cpu.bus.load(0xFFFA, [0x00, 0x07])  # NMI vector -> $0700
+        self.cpu.bus.load(0xFFFE, [0x00, 0x08])  # IRQ vector -> $0800
+        self.cpu.bus.load(0x0700, [0xA9, 0x07])  # LDA #$07
+        self.cpu.bus.load(0x0800, [0xA9, 0x08])  # LDA #$08
+        self.cpu.registers.update_register('PC', 0x0600)
+        self.cpu.registers.update_flag('I', 0)
+        self.cpu.request_interrupt('NMI')
+        self.cpu.request_interrupt('IRQ')
+        self.cpu.run()
+        # NMI is serviced first and sets I, which keeps the IRQ waiting
+        self.assertEqual(self.cpu.registers.get_register('A'), 0x07)
+        self.assertEqual(self.cpu.pending_interrupts, {'IRQ'})
+
+    def test_nmi_pushes_frame(self):
+        self.cpu.registers.update_register('PC', 0x1234)
+        self.cpu.nmi()
+        self.assertEqual(self.cpu.bus.read(0x01FF), 0x12)
+        self.assertEqual(self.cpu.bus.read(0x01FE), 0x34)
+        self.assertEqual(self.cpu.bus.read(0x01FD), 0x24)
+        self.assertEqual(self.cpu.registers.get_register('SP'), 0xFC)
+        self.assertEqual(self.cpu.registers.get_flag('I'), 1)
+
+    def test_stack_push_pop(self):
+        self.cpu.push_stack_word(0xBEEF)
+        self.assertEqual(self.cpu.bus.read(0x01FF), 0xBE)
+        self.assertEqual(self.cpu.pop_stack_word(), 0xBEEF)
+        self.assertEqual(self.cpu.registers.get_register('SP'), 0xFF)
+
+    def test_run_asl(self):
+        # LDA #$81; ASL A; STA $10; ASL $10
+        self.cpu.bus.load(0x0600, [0xA9, 0x81, 0x0A, 0x85, 0x10, 0x06, 0x10])
+        self.cpu.registers.update_register('PC', 0x0600)
+        self.cpu.run()
+        self.assertEqual(self.cpu.registers.get_register('A'), 0x02)
+        self.assertEqual(self.cpu.bus.read(0x0010), 0x04)
+        self.assertEqual(self.cpu.registers.get_flag('C'), 0)
+
+    def test_initialize_registers_keeps_cpu_view(self):
+        self.cpu.registers.initialize_registers()
+        self.cpu.regs['A'] = 0x05
+        self.assertEqual(self.cpu.registers.get_register('A'), 0x05)
+
+    def test_snapshot_restore(self):
+        self.cpu.registers.update_register('A', 0x12)
+        self.cpu.registers.update_register('PC', 0x0634)
+        self.cpu.registers.update_flag('C', 1)
+        state = self.cpu.registers.snapshot()
+        self.cpu.registers.reset(0)
+        self.cpu.registers.restore(state)
+        self.assertEqual(self.cpu.registers.get_register('A'), 0x12)
+        self.assertEqual(self.cpu.registers.get_register('PC'), 0x0634)
+        self.assertEqual(self.cpu.registers.get_flag('C'), 1)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file